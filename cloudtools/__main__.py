@@ -4,6 +4,7 @@ import start
 import submit
 import connect
 import diagnose
+import monitor
 import stop
 
 
@@ -20,6 +21,9 @@ def main():
     connect_parser = subs.add_parser('connect',
                                      help='Connect to a running Dataproc cluster.',
                                      description='Connect to a running Dataproc cluster.')
+    monitor_parser = subs.add_parser('monitor',
+                                     help='Monitor Spark jobs on a running Dataproc cluster from the terminal.',
+                                     description='Monitor Spark jobs on a running Dataproc cluster from the terminal.')
     diagnose_parser = subs.add_parser('diagnose',
                                       help='Diagnose problems in a Dataproc cluster.',
                                       description='Diagnose problems in a Dataproc cluster.')
@@ -36,6 +40,9 @@ def main():
     connect_parser.set_defaults(module='connect')
     connect.init_parser(connect_parser)
 
+    monitor_parser.set_defaults(module='monitor')
+    monitor.init_parser(monitor_parser)
+
     diagnose_parser.set_defaults(module='diagnose')
     diagnose.init_parser(diagnose_parser)
 
@@ -57,6 +64,9 @@ def main():
     elif args.module == 'connect':
         connect.main(args)
 
+    elif args.module == 'monitor':
+        monitor.main(args)
+
     elif args.module == 'diagnose':
         diagnose.main(args)
 
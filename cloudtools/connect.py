@@ -1,6 +1,25 @@
 import os
+import signal
 from subprocess import Popen, check_call
 
+# shortcut mapping
+shortcut = {
+    'ui': 'spark-ui',
+    'ui1': 'spark-ui1',
+    'ui2': 'spark-ui2',
+    'hist': 'spark-history',
+    'nb': 'notebook'
+}
+
+# Dataproc port mapping
+dataproc_ports = {
+    'spark-ui': 4040,
+    'spark-ui1': 4041,
+    'spark-ui2': 4042,
+    'spark-history': 18080,
+    'notebook': 8123
+}
+
 
 def init_parser(parser):
     parser.add_argument('name', type=str, help='Cluster name.')
@@ -13,46 +32,44 @@ def init_parser(parser):
     parser.add_argument('--zone', '-z', default='us-central1-b', type=str,
                         help='Compute zone for Dataproc cluster (default: %(default)s).')
 
-def main(args):
-    print("Connecting to cluster '{}'...".format(args.name))
-
-    # shortcut mapping
-    shortcut = {
-        'ui': 'spark-ui',
-        'ui1': 'spark-ui1',
-        'ui2': 'spark-ui2',
-        'hist': 'history',
-        'nb': 'notebook'
-    }
-
-    service = args.service
-    if service in shortcut:
-        service = shortcut[service]
 
-    # Dataproc port mapping
-    dataproc_ports = {
-        'spark-ui': 4040,
-        'spark-ui1': 4041,
-        'spark-ui2': 4042,
-        'spark-history': 18080,
-        'notebook': 8123
-    }
-    connect_port = dataproc_ports[service]
-
-    # open SSH tunnel to master node
+def open_tunnel(name, zone, port, background=True):
+    # open SSH tunnel to master node, serving a SOCKS proxy on the local port
     cmd = [
         'gcloud',
         'compute',
         'ssh',
-        '{}-m'.format(args.name),
-        '--zone={}'.format(args.zone),
-        '--ssh-flag=-D {}'.format(args.port),
+        '{}-m'.format(name),
+        '--zone={}'.format(zone),
+        '--ssh-flag=-D {}'.format(port),
         '--ssh-flag=-N',
-        '--ssh-flag=-f',
         '--ssh-flag=-n'
     ]
+
+    # a background tunnel outlives this process; otherwise the ssh process is returned for close_tunnel
     with open(os.devnull, 'w') as f:
-        check_call(cmd, stdout=f, stderr=f)
+        if background:
+            check_call(cmd + ['--ssh-flag=-f'], stdout=f, stderr=f)
+        else:
+            # own process group, so that closing it also stops the ssh process that gcloud starts
+            return Popen(cmd, stdout=f, stderr=f, preexec_fn=os.setsid)
+
+
+def close_tunnel(tunnel):
+    if tunnel.poll() is None:
+        os.killpg(tunnel.pid, signal.SIGTERM)
+        tunnel.wait()
+
+
+def main(args):
+    print("Connecting to cluster '{}'...".format(args.name))
+
+    service = args.service
+    if service in shortcut:
+        service = shortcut[service]
+    connect_port = dataproc_ports[service]
+
+    open_tunnel(args.name, args.zone, args.port)
 
     # open Chrome with SOCKS proxy configuration
     cmd = [
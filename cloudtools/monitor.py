@@ -0,0 +1,233 @@
+import sys
+import json
+import time
+import socket
+from subprocess import check_output, CalledProcessError
+
+from connect import shortcut, dataproc_ports, open_tunnel, close_tunnel
+
+
+def init_parser(parser):
+    parser.add_argument('name', type=str, help='Cluster name.')
+    parser.add_argument('service', type=str, nargs='?', default='spark-ui',
+                        choices=['spark-ui', 'ui', 'spark-ui1', 'ui1', 'spark-ui2', 'ui2', 'spark-history', 'hist'],
+                        help='Spark web service to poll (default: %(default)s).')
+    parser.add_argument('--port', '-p', default='10000', type=str,
+                        help='Local port to use for SSH tunnel to master node (default: %(default)s).')
+    parser.add_argument('--zone', '-z', default='us-central1-b', type=str,
+                        help='Compute zone for Dataproc cluster (default: %(default)s).')
+    parser.add_argument('--interval', '-i', default=5, type=float,
+                        help='Seconds between samples (default: %(default)s).')
+    parser.add_argument('--count', '-n', default=0, type=int,
+                        help='Number of samples to take before exiting, 0 to run until interrupted (default: %(default)s).')
+    parser.add_argument('--output', '-o', required=False, type=str,
+                        help='Local file to append samples to as JSON lines.')
+    parser.add_argument('--no-tunnel', required=False, action='store_true',
+                        help='Reuse an SSH tunnel already open on the local port (e.g. from cluster connect) '
+                             'instead of opening one for the duration of the command.')
+
+
+def fmt_bytes(n):
+    for unit in ['B', 'K', 'M', 'G', 'T']:
+        if abs(n) < 1024.0:
+            return '{:.1f}{}'.format(n, unit)
+        n /= 1024.0
+    return '{:.1f}P'.format(n)
+
+
+def wait_for_tunnel(tunnel, port, timeout=60):
+    # the ssh process runs in the foreground, so wait until its SOCKS port accepts connections
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if tunnel.poll() is not None:
+            return False
+        s = socket.socket()
+        try:
+            s.connect(('localhost', int(port)))
+            return True
+        except socket.error:
+            time.sleep(1)
+        finally:
+            s.close()
+    return False
+
+
+def main(args):
+    print("Monitoring cluster '{}'...".format(args.name))
+
+    service = args.service
+    if service in shortcut:
+        service = shortcut[service]
+    api_root = 'http://localhost:{}/api/v1'.format(dataproc_ports[service])
+
+    tunnel = None
+    if not args.no_tunnel:
+        tunnel = open_tunnel(args.name, args.zone, args.port, background=False)
+        if not wait_for_tunnel(tunnel, args.port):
+            close_tunnel(tunnel)
+            sys.exit("Could not open SSH tunnel to '{}-m' on local port {}.".format(args.name, args.port))
+
+    # query the Spark REST API on the master node through the SOCKS proxy; hostnames are
+    # resolved on the far side of the tunnel, so localhost refers to the master node
+    def get(path):
+        cmd = [
+            'curl',
+            '--silent',
+            '--fail',
+            '--location',
+            '--max-time', '10',
+            '--socks5-hostname', 'localhost:{}'.format(args.port),
+            api_root + path
+        ]
+        try:
+            return json.loads(check_output(cmd))
+        except ValueError:
+            raise ValueError('Response from {} is not JSON.'.format(api_root + path))
+
+    # allexecutors (Spark 2.1+) also lists lost executors, so totals don't drop when workers are preempted;
+    # which endpoint the server supports is worked out on the first poll and reused afterwards
+    executors_endpoint = {}
+
+    def get_executors(app_id):
+        if 'path' not in executors_endpoint:
+            try:
+                executors = get('/applications/{}/allexecutors'.format(app_id))
+                executors_endpoint['path'] = 'allexecutors'
+                return executors
+            except CalledProcessError as e:
+                # curl exits with 22 on an HTTP error status, here a 404 from Spark 2.0
+                if e.returncode != 22:
+                    raise
+                executors_endpoint['path'] = 'executors'
+        return get('/applications/{}/{}'.format(app_id, executors_endpoint['path']))
+
+    def take_sample():
+        apps = get('/applications')
+        if not apps:
+            return None
+        app = apps[0]
+        stages = get('/applications/{}/stages?status=active'.format(app['id']))
+        executors = [e for e in get_executors(app['id']) if e['id'] != 'driver']
+
+        return {
+            'time': time.time(),
+            'app_id': app['id'],
+            'app_name': app['name'],
+            'stages': [{
+                'stage_id': s['stageId'],
+                'attempt_id': s['attemptId'],
+                'name': s['name'],
+                # numTasks is only reported from Spark 2.3 on
+                'num_tasks': s.get('numTasks', s['numActiveTasks'] + s['numCompleteTasks'] + s['numFailedTasks']),
+                'active_tasks': s['numActiveTasks'],
+                'complete_tasks': s['numCompleteTasks'],
+                'failed_tasks': s['numFailedTasks'],
+                'input_bytes': s['inputBytes'],
+                'shuffle_read_bytes': s['shuffleReadBytes'],
+                'shuffle_write_bytes': s['shuffleWriteBytes']
+            } for s in stages],
+            'executors': [{
+                'id': e['id'],
+                'host_port': e['hostPort'],
+                'is_active': e.get('isActive', True),
+                'active_tasks': e['activeTasks'],
+                'completed_tasks': e['completedTasks'],
+                'failed_tasks': e['failedTasks'],
+                'memory_used': e['memoryUsed'],
+                'max_memory': e['maxMemory'],
+                'shuffle_read_bytes': e['totalShuffleRead'],
+                'shuffle_write_bytes': e['totalShuffleWrite']
+            } for e in executors]
+        }
+
+    def totals(sample):
+        ex = sample['executors']
+        return (sum(e['completed_tasks'] for e in ex),
+                sum(e['shuffle_read_bytes'] for e in ex),
+                sum(e['shuffle_write_bytes'] for e in ex))
+
+    def render(sample, prev):
+        lines = ['{} ({})  {}'.format(sample['app_name'], sample['app_id'],
+                                      time.strftime('%H:%M:%S', time.localtime(sample['time'])))]
+
+        # rates are computed from executor totals between consecutive samples of the same application,
+        # clamped at zero in case lost executors drop out of the totals
+        tasks, read, write = totals(sample)
+        if prev and prev['app_id'] == sample['app_id']:
+            elapsed = sample['time'] - prev['time']
+            p_tasks, p_read, p_write = totals(prev)
+            lines.append('Throughput: {:.1f} tasks/s   Shuffle read: {}/s   Shuffle write: {}/s'.format(
+                max(tasks - p_tasks, 0) / elapsed,
+                fmt_bytes(max(read - p_read, 0) / elapsed),
+                fmt_bytes(max(write - p_write, 0) / elapsed)))
+        else:
+            lines.append('Throughput: -   Shuffle read: -   Shuffle write: -')
+
+        lines.append('')
+        lines.append('Active stages:')
+        lines.append('  {:>6} {:>17} {:>7} {:>7} {:>9} {:>9}  {}'.format(
+            'stage', 'tasks (done/all)', 'active', 'failed', 'shuf rd', 'shuf wr', 'name'))
+        for s in sample['stages']:
+            lines.append('  {:>6} {:>17} {:>7} {:>7} {:>9} {:>9}  {}'.format(
+                '{}.{}'.format(s['stage_id'], s['attempt_id']),
+                '{}/{}'.format(s['complete_tasks'], s['num_tasks']),
+                s['active_tasks'], s['failed_tasks'],
+                fmt_bytes(s['shuffle_read_bytes']), fmt_bytes(s['shuffle_write_bytes']),
+                s['name'][:40]))
+        if not sample['stages']:
+            lines.append('  (none)')
+
+        lines.append('')
+        lines.append('Executors:')
+        lines.append('  {:>4} {:>28} {:>7} {:>9} {:>19} {:>9} {:>9}'.format(
+            'id', 'host', 'active', 'complete', 'memory (used/max)', 'shuf rd', 'shuf wr'))
+        for e in sample['executors']:
+            if not e['is_active']:
+                continue
+            lines.append('  {:>4} {:>28} {:>7} {:>9} {:>19} {:>9} {:>9}'.format(
+                e['id'], e['host_port'][:28], e['active_tasks'], e['completed_tasks'],
+                '{}/{}'.format(fmt_bytes(e['memory_used']), fmt_bytes(e['max_memory'])),
+                fmt_bytes(e['shuffle_read_bytes']), fmt_bytes(e['shuffle_write_bytes'])))
+
+        # clear the terminal and redraw from the top-left corner
+        sys.stdout.write('\033[H\033[2J' + '\n'.join(lines) + '\n')
+        sys.stdout.flush()
+
+    out = open(args.output, 'a') if args.output else None
+    prev = None
+    n = 0
+    try:
+        while args.count == 0 or n < args.count:
+            error = None
+            sample = None
+            try:
+                sample = take_sample()
+                if not sample:
+                    error = 'No running Spark application found at {}.'.format(api_root)
+            except CalledProcessError as e:
+                error = 'Request to {} failed (curl exit {}).'.format(e.cmd[-1], e.returncode)
+            except ValueError as e:
+                error = str(e)
+            except KeyError as e:
+                error = 'Spark REST response is missing field {}.'.format(e)
+
+            if sample:
+                render(sample, prev)
+                if out:
+                    out.write(json.dumps(sample) + '\n')
+                    out.flush()
+                prev = sample
+            else:
+                sys.stdout.write('\033[H\033[2J' + error + '\n')
+                sys.stdout.flush()
+
+            n += 1
+            if args.count == 0 or n < args.count:
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out:
+            out.close()
+        if tunnel:
+            close_tunnel(tunnel)
@@ -1,4 +1,38 @@
-from subprocess import check_output, call
+import re
+import sys
+import argparse
+import json
+import time
+from subprocess import check_output, call, Popen, PIPE, STDOUT, CalledProcessError
+
+# substrings of a job's failure cause that indicate work was lost to preempted workers
+# (YARN reports containers on reclaimed preemptible VMs with exit status -100). ExecutorLostFailure
+# and FetchFailed are deliberately absent: Spark reports them for any lost executor, whatever the
+# cause, so they only count when one of these signals appears alongside them.
+preemption_patterns = [
+    'preempt',
+    'exit status: -100',
+    'released on a *lost* node',
+    'exited unrelated to the running tasks'
+]
+
+# substrings of a job's failure cause that indicate it failed on its own, so resubmitting would fail again
+# (executor exit status 52 is a JVM OOM, 137 and 143 are kills, e.g. by YARN for exceeding memory)
+fatal_patterns = [
+    'exceeding memory limits',
+    'outofmemoryerror',
+    'exited caused by one of the running tasks',
+    'exit status: 52',
+    'exit status: 137',
+    'exit status: 143'
+]
+
+
+def non_negative_int(value):
+    n = int(value)
+    if n < 0:
+        raise argparse.ArgumentTypeError('must be non-negative, found {}'.format(value))
+    return n
 
 def init_parser(parser):
     parser.add_argument('name', type=str, help='Cluster name.')
@@ -14,6 +48,76 @@ def init_parser(parser):
     parser.add_argument('--files', required=False, type=str, help='Comma-separated list of files to add to the working directory of the Hail application.')
     parser.add_argument('--properties', '-p', required=False, type=str, help='Extra Spark properties to set.')
     parser.add_argument('--args', type=str, help='Quoted string of arguments to pass to the Hail script being submitted.')
+    parser.add_argument('--retries', default=0, type=non_negative_int,
+                        help='Number of times to resubmit the job if it fails due to worker preemption (default: %(default)s).')
+    parser.add_argument('--retry-backoff', default=60, type=non_negative_int,
+                        help='Seconds to wait before the first resubmission, doubled after each retry (default: %(default)s).')
+    parser.add_argument('--checkpoint', required=False, type=str,
+                        help='Stable path prefix (e.g. gs://bucket/run1/) passed to the script as the spark.cloudtools.checkpoint property, for skipping completed work on retry.')
+    parser.add_argument('--retry-log', required=False, type=str,
+                        help='Local file to append a JSON line to for each submission attempt.')
+
+
+def failure_cause(output, details):
+    # only look at the error that ended the driver, since lost executors that Spark recovered
+    # from (spark.task.maxFailures) show up in the output of jobs that go on to fail for other reasons
+    traceback = 'Traceback (most recent call last):'
+    tail = output.rsplit(traceback, 1)[-1]
+
+    # reason Spark gave for aborting the job
+    m = re.findall(r'Job aborted due to stage failure: (.*)', tail)
+    if m:
+        return m[-1]
+
+    # otherwise the exception following the frames of the last Python traceback, up to the next blank
+    # or gcloud ERROR: line; unindented continuation lines carry the Java cause of a Py4JJavaError
+    # (': org.apache...', 'Caused by: ...'), while indented Java stack frames are skipped
+    if traceback in output:
+        cause = []
+        for line in tail.splitlines()[1:]:
+            if cause and (not line.strip() or line.startswith('ERROR:')):
+                break
+            if line and not line[0].isspace():
+                cause.append(line)
+        if cause:
+            return '\n'.join(cause)
+
+    return details
+
+
+def is_preemption(cause):
+    cause = cause.lower()
+    if any(p in cause for p in fatal_patterns):
+        return False
+    return any(p in cause for p in preemption_patterns)
+
+
+def run_job(cmd):
+    # stream job output to the terminal while keeping a copy to inspect on failure
+    p = Popen(cmd, stdout=PIPE, stderr=STDOUT)
+    output = []
+    for line in iter(p.stdout.readline, b''):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+        output.append(line)
+    p.wait()
+    output = ''.join(output)
+
+    # state is left unknown unless Dataproc reports it, so a job that is still running is never resubmitted
+    job_id = None
+    state = None
+    details = ''
+    m = re.search(r'Job \[(?P<job>\S+)\] submitted', output)
+    if m:
+        job_id = m.group('job')
+        try:
+            status = json.loads(check_output(['gcloud', 'dataproc', 'jobs', 'describe', job_id, '--format', 'json']))['status']
+            state = status['state']
+            details = status.get('details', '')
+        except (CalledProcessError, ValueError, KeyError):
+            pass
+
+    return p.returncode, job_id, state, failure_cause(output, details)
 
 
 def main(args):
@@ -49,6 +153,8 @@ def main(args):
     properties = 'spark.driver.extraClassPath=./{0},spark.executor.extraClassPath=./{0}'.format(hail_jar)
     if args.properties:
         properties = properties + ',' + args.properties
+    if args.checkpoint:
+        properties = properties + ',spark.cloudtools.checkpoint={}'.format(args.checkpoint)
 
     # pyspark submit command
     cmd = [
@@ -75,4 +181,60 @@ def main(args):
     print(' '.join(cmd[:6]) + ' \\\n    ' + ' \\\n    '.join(cmd[6:]))
 
     # submit job
-    call(cmd)
+    if not args.retries:
+        call(cmd)
+        return
+
+    # submit job, resubmitting after failures caused by preemption
+    attempts = []
+    backoff = args.retry_backoff
+    for attempt in range(args.retries + 1):
+        start = time.time()
+        returncode, job_id, state, cause = run_job(cmd)
+        end = time.time()
+
+        preempted = returncode != 0 and state == 'ERROR' and is_preemption(cause)
+        record = {
+            'cluster': args.name,
+            'script': args.script,
+            'checkpoint': args.checkpoint,
+            'attempt': attempt,
+            'job_id': job_id,
+            'state': state,
+            'preempted': preempted,
+            'cause': cause if returncode != 0 else None,
+            'start': start,
+            'end': end,
+            'elapsed': end - start,
+            'backoff': 0
+        }
+        attempts.append(record)
+
+        retry = preempted and attempt < args.retries
+        if retry:
+            record['backoff'] = backoff
+        if args.retry_log:
+            with open(args.retry_log, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+        if not retry:
+            break
+
+        print("Job '{}' failed due to preemption, resubmitting in {} seconds (retry {} of {})...".format(
+            job_id, backoff, attempt + 1, args.retries))
+        time.sleep(backoff)
+        backoff *= 2
+
+    # time lost is the runtime of preempted attempts plus time spent waiting to resubmit
+    time_lost = sum(r['elapsed'] + r['backoff'] for r in attempts if r['preempted'])
+    print('Submitted {} time(s), {} retry(s), {:.0f} seconds lost to preemption.'.format(
+        len(attempts), len(attempts) - 1, time_lost))
+
+    if returncode != 0:
+        if state != 'ERROR':
+            print("Job state is '{}' rather than 'ERROR', not resubmitting.".format(state))
+        elif not preempted:
+            print('Job failed for a reason other than preemption, not resubmitting: {}'.format(cause))
+        else:
+            print('Job failed due to preemption and no retries remain.')
+        sys.exit(returncode)